@@ -3,10 +3,10 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import plotly.graph_objects as go
-import akshare as ak
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
-import threading
+
+from data_service import get_spot_snapshot, get_daily_hist
 
 st.set_page_config(page_title="连板回调策略", layout="wide")
 
@@ -42,42 +42,39 @@ st.sidebar.markdown("""
 st.sidebar.markdown("---")
 st.sidebar.info("💡 使用多线程并发处理，大幅提升扫描速度！")
 
-def is_valid_stock(stock_code, stock_name):
-    """检查股票是否符合条件"""
-    if 'ST' in stock_name or 'st' in stock_name:
-        return False
-    
-    if stock_code.startswith('8') or stock_code.startswith('4'):
-        return False
-    
-    if not (stock_code.startswith('6') or stock_code.startswith('0') or stock_code.startswith('3')):
-        return False
-    
-    return True
+def filter_valid_stocks(stock_list):
+    """向量化筛选：剔除ST股票和北交所，只保留沪深A股"""
+    codes = stock_list['代码'].astype(str)
+    names = stock_list['名称'].astype(str)
+    # 只保留6/0/3开头的沪深A股，天然排除了北交所(8/4/9开头)
+    mask = (
+        ~(names.str.contains('ST', regex=False) | names.str.contains('st', regex=False))
+        & codes.str.startswith(('6', '0', '3'))
+    )
+    return stock_list.loc[mask, ['代码', '名称']]
 
 def get_stock_data(stock_code, days=100):
     """获取股票数据"""
     try:
-        df = ak.stock_zh_a_hist(symbol=stock_code, period="daily", adjust="qfq")
-        
+        # 只请求策略需要的时间窗口（交易日约占日历日的2/3）
+        start_date = (datetime.now() - timedelta(days=int(days * 1.6))).strftime('%Y%m%d')
+        df = get_daily_hist(stock_code, start_date, datetime.now().strftime('%Y-%m-%d'))
+
         if df is None or len(df) == 0:
             return None
         
-        df = df.tail(days)
-        
-        df = df.rename(columns={
-            '日期': '日期',
-            '收盘': '收盘价',
-            '开盘': '开盘价',
-            '最高': '最高价',
-            '最低': '最低价',
-            '涨跌幅': '涨跌幅'
-        })
-        
+        # 只保留策略用到的列，再截取尾部，避免整表复制
+        cols = ['日期', '收盘'] + (['涨跌幅'] if '涨跌幅' in df.columns else [])
+        df = df[cols].rename(columns={'收盘': '收盘价'}).tail(days)
+
         # 确保有涨跌幅列
         if '涨跌幅' not in df.columns:
             df['涨跌幅'] = df['收盘价'].pct_change() * 100
-        
+
+        # 价格精度4位有效数字，float32足够，内存减半
+        df['收盘价'] = df['收盘价'].astype(np.float32)
+        df['涨跌幅'] = df['涨跌幅'].astype(np.float32)
+
         return df
     except Exception as e:
         return None
@@ -89,47 +86,36 @@ def detect_lianban_callback(df):
     """
     if df is None or len(df) < 20:
         return False, 0, 0, None, 0, 0, 0
-    
-    df = df.copy()
-    
+
+    close = df['收盘价'].to_numpy()
+
     # 判断涨停（涨幅 >= 9.5%，考虑误差）
-    df['是否涨停'] = df['涨跌幅'] >= 9.5
-    
-    # 寻找连板（至少2个涨停）
-    lianban_found = False
-    lianban_end_idx = -1
-    lianban_days = 0
-    lianban_high_price = 0
-    lianban_date = None
-    
-    consecutive_count = 0
-    
-    for i in range(len(df)):
-        if df.iloc[i]['是否涨停']:
-            consecutive_count += 1
-        else:
-            # 连续涨停结束
-            if consecutive_count >= 2:  # 至少2个涨停才算连板
-                lianban_found = True
-                lianban_days = consecutive_count
-                lianban_end_idx = i - 1
-                lianban_high_price = df.iloc[lianban_end_idx]['收盘价']
-                lianban_date = df.iloc[lianban_end_idx]['日期']
-                break
-            consecutive_count = 0
-    
-    if not lianban_found:
+    zt = (df['涨跌幅'].to_numpy() >= 9.5).astype(np.int8)
+
+    # 寻找连板（至少2个涨停）：对涨停序列做游程编码，
+    # 取第一段长度>=2、且后面出现过非涨停日的连续涨停
+    starts = np.flatnonzero(np.diff(zt, prepend=np.int8(0)) == 1)
+    ends = np.flatnonzero(np.diff(zt, append=np.int8(0)) == -1)
+    lengths = ends - starts + 1
+    valid = (lengths >= 2) & (ends < len(zt) - 1)
+
+    if not valid.any():
         return False, 0, 0, None, 0, 0, 0
-    
+
+    k = int(np.argmax(valid))
+    lianban_end_idx = int(ends[k])
+    lianban_days = int(lengths[k])
+    lianban_high_price = close[lianban_end_idx]
+    lianban_date = df['日期'].iloc[lianban_end_idx]
+
     # 计算从连板结束后的回调天数
     callback_days = len(df) - lianban_end_idx - 1
-    
+
     # 检查回调期间是否再次涨停
-    callback_period = df.iloc[lianban_end_idx + 1:]
-    has_zhangting_in_callback = callback_period['是否涨停'].any()
-    
+    has_zhangting_in_callback = bool(zt[lianban_end_idx + 1:].any())
+
     # 当前价格
-    current_price = df.iloc[-1]['收盘价']
+    current_price = close[-1]
     
     # 计算回调幅度
     callback_rate = ((current_price - lianban_high_price) / lianban_high_price) * 100
@@ -154,7 +140,7 @@ def process_single_stock(stock_info, days_input):
             is_match, lianban_days, callback_days, lianban_date, high_price, current_price, callback_rate = detect_lianban_callback(df_stock)
             
             if is_match:
-                latest_date = df_stock.iloc[-1]['日期']
+                latest_date = df_stock['日期'].iloc[-1]
                 
                 # 计算风险等级
                 if callback_rate >= -10:
@@ -169,10 +155,10 @@ def process_single_stock(stock_info, days_input):
                     '股票名称': name,
                     '连板天数': lianban_days,
                     '连板日期': str(lianban_date)[:10],
-                    '连板最高价': f"{high_price:.2f}",
-                    '当前价格': f"{current_price:.2f}",
+                    '连板最高价': round(float(high_price), 2),
+                    '当前价格': round(float(current_price), 2),
                     '回调天数': callback_days,
-                    '回调幅度': f"{callback_rate:.2f}%",
+                    '回调幅度': round(float(callback_rate), 2),
                     '风险等级': risk,
                     '更新日期': str(latest_date)[:10]
                 }
@@ -206,15 +192,10 @@ if st.button("🚀 开始全市场扫描（多线程加速）", type="primary"):
     try:
         # 获取A股列表
         status_text.text("正在获取A股列表...")
-        stock_list = ak.stock_zh_a_spot_em()
+        stock_list = get_spot_snapshot()
         
-        # 筛选有效股票
-        valid_stocks = []
-        for idx, row in stock_list.iterrows():
-            code = row['代码']
-            name = row['名称']
-            if is_valid_stock(code, name):
-                valid_stocks.append({'代码': code, '名称': name})
+        # 筛选有效股票（整表向量化过滤，不再逐行判断）
+        valid_stocks = filter_valid_stocks(stock_list).to_dict('records')
         
         # 限制扫描数量
         valid_stocks = valid_stocks[:max_stocks]
@@ -223,10 +204,10 @@ if st.button("🚀 开始全市场扫描（多线程加速）", type="primary"):
         status_text.text(f"找到 {total_stocks} 只有效股票，使用 {thread_count} 个线程并发分析...")
         
         # 使用多线程处理
+        # results 只在主线程（as_completed 循环）里追加，无需加锁
         results = []
         completed = 0
-        lock = threading.Lock()
-        
+
         with ThreadPoolExecutor(max_workers=thread_count) as executor:
             # 提交所有任务
             future_to_stock = {
@@ -235,19 +216,22 @@ if st.button("🚀 开始全市场扫描（多线程加速）", type="primary"):
             }
             
             # 处理完成的任务
+            last_ui_update = 0.0
             for future in as_completed(future_to_stock):
                 completed += 1
-                
-                # 更新进度
-                progress = completed / total_stocks
-                progress_bar.progress(progress)
-                status_text.text(f"进度: {completed}/{total_stocks} ({progress*100:.1f}%) - 使用{thread_count}线程并发处理")
-                
+
                 # 获取结果
                 result = future.result()
                 if result is not None:
-                    with lock:
-                        results.append(result)
+                    results.append(result)
+
+                # 更新进度（节流到每0.1秒一次，避免刷爆前端）
+                now = time.monotonic()
+                if now - last_ui_update > 0.1 or completed == total_stocks:
+                    last_ui_update = now
+                    progress = completed / total_stocks
+                    progress_bar.progress(progress)
+                    status_text.text(f"进度: {completed}/{total_stocks} ({progress*100:.1f}%) - 使用{thread_count}线程并发处理")
         
         end_time = time.time()
         elapsed_time = end_time - start_time
@@ -262,8 +246,11 @@ if st.button("🚀 开始全市场扫描（多线程加速）", type="primary"):
             result_df = pd.DataFrame(results)
             
             # 按回调天数排序（刚好14天的排在前面）
-            result_df['回调天数_int'] = result_df['回调天数']
-            result_df = result_df.sort_values('回调天数_int')
+            result_df = result_df.sort_values('回调天数')
+
+            # 数值列保持原始精度用于统计/图表，展示时统一格式化
+            show_df = result_df.copy()
+            show_df['回调幅度'] = result_df['回调幅度'].map('{:.2f}%'.format)
             
             # 统计信息
             st.subheader("📊 筛选结果统计")
@@ -287,11 +274,11 @@ if st.button("🚀 开始全市场扫描（多线程加速）", type="primary"):
             st.subheader("📋 股票列表（按回调天数排序）")
             
             # 显示表格
-            display_df = result_df[['股票代码', '股票名称', '连板天数', '连板日期', '连板最高价', '当前价格', '回调天数', '回调幅度', '风险等级']]
+            display_df = show_df[['股票代码', '股票名称', '连板天数', '连板日期', '连板最高价', '当前价格', '回调天数', '回调幅度', '风险等级']]
             st.dataframe(display_df, use_container_width=True, height=600)
             
             # 下载按钮
-            csv = result_df.to_csv(index=False, encoding='utf-8-sig')
+            csv = show_df.to_csv(index=False, encoding='utf-8-sig')
             st.download_button(
                 label="📥 下载结果（CSV）",
                 data=csv,
@@ -304,8 +291,7 @@ if st.button("🚀 开始全市场扫描（多线程加速）", type="primary"):
             
             with col1:
                 with st.expander("📈 回调幅度分布"):
-                    # 将回调幅度转换为数字
-                    callback_rates = result_df['回调幅度'].str.replace('%', '').astype(float)
+                    callback_rates = result_df['回调幅度']
                     fig = go.Figure(data=[go.Histogram(x=callback_rates, nbinsx=20)])
                     fig.update_layout(
                         title="回调幅度分布",
@@ -328,7 +314,7 @@ if st.button("🚀 开始全市场扫描（多线程加速）", type="primary"):
             # 重点关注：回调12-13天的股票
             st.subheader("⭐ 符合条件的股票（回调12-13天）")
             st.info(f"共找到 {len(result_df)} 只股票，这些是最佳介入时机！")
-            st.dataframe(result_df[['股票代码', '股票名称', '连板天数', '连板日期', '当前价格', '回调天数', '回调幅度', '风险等级']], use_container_width=True)
+            st.dataframe(show_df[['股票代码', '股票名称', '连板天数', '连板日期', '当前价格', '回调天数', '回调幅度', '风险等级']], use_container_width=True)
             
         else:
             st.warning(f"⚠️ 未找到符合条件的股票（耗时{elapsed_time:.1f}秒），请增加扫描数量或调整数据天数")
@@ -0,0 +1,31 @@
+import time
+
+import streamlit as st
+import akshare as ak
+
+# ── 两个扫描器共用的数据访问层 ──
+# 拉取和缓存逻辑集中在这里，避免 app.py / yz.py 各自重复实现
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_spot_snapshot():
+    """全市场实时快照，60秒内重复扫描直接复用"""
+    return ak.stock_zh_a_spot_em()
+
+@st.cache_data(ttl=600, show_spinner=False)
+def get_industry_cons(sector):
+    """板块成份股，10分钟内重复扫描同一板块直接复用"""
+    return ak.stock_board_industry_cons_em(symbol=sector)
+
+@st.cache_data(ttl=3600, max_entries=8192, persist="disk", show_spinner=False)
+def get_daily_hist(stock_code, start_date, cache_date):
+    """前复权日线历史，按(代码, 起始日, 日期)缓存，当天内重复扫描不再请求接口
+
+    接口偶发限流/超时，指数退避重试3次，避免整只股票被静默丢弃。
+    """
+    for attempt in range(3):
+        try:
+            return ak.stock_zh_a_hist(symbol=stock_code, period="daily", start_date=start_date, adjust="qfq")
+        except Exception:
+            if attempt == 2:
+                raise
+            time.sleep(2 ** attempt)
@@ -3,10 +3,11 @@ import pandas as pd
 import akshare as ak
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import deque
 import io
 from datetime import datetime, timedelta, timezone
 import plotly.express as px
-from functools import lru_cache
+from data_service import get_spot_snapshot, get_industry_cons, get_daily_hist
 
 # ── 页面基础配置 ──
 st.set_page_config(
@@ -35,8 +36,8 @@ def check_password():
     return True
 
 # ── 北京时间工具 ──
-@st.cache_data(ttl=60)
 def get_beijing_time():
+    # 直接格式化比走Streamlit缓存管理器更便宜，不值得加缓存
     tz = timezone(timedelta(hours=8))
     return datetime.now(tz).strftime("%Y-%m-%d %H:%M:%S")
 
@@ -46,41 +47,52 @@ def get_all_sectors():
     return ak.stock_board_industry_name_em()['板块名称'].tolist()
 
 # ── 单只股票处理逻辑（核心判定） ──
-@lru_cache(maxsize=500)
 def fetch_stock_hist(code):
     try:
-        return ak.stock_zh_a_hist(symbol=code, period="daily", adjust="qfq").tail(8)
+        # 按交易日缓存（data_service），全市场扫描不会像lru_cache(500)那样被挤爆
+        start_date = (datetime.now() - timedelta(days=30)).strftime('%Y%m%d')
+        return get_daily_hist(code, start_date, datetime.now().strftime('%Y-%m-%d')).tail(8)
     except:
         return pd.DataFrame()
 
-def process_single_stock(code, name, current_price, turnover_rate, sector_info):
+def process_single_stock(code, name, current_price, turnover_rate, sector_info, scan_ts):
     hist = fetch_stock_hist(code)
     if hist.empty or len(hist) < 5:
         return None
 
+    # 开盘/收盘只提取一次，阳线布尔数组三个窗口共用
+    opens = hist['开盘'].to_numpy()
+    closes = hist['收盘'].to_numpy()
+    is_up = closes > opens
+
     # 超过7连阳直接剔除
-    if len(hist) == 8 and (hist['收盘'] > hist['开盘']).all():
+    if len(is_up) == 8 and is_up.all():
         return None
 
-    hist_7 = hist.tail(7)
+    opens_7 = opens[-7:]
+    closes_7 = closes[-7:]
+    is_up_7 = is_up[-7:]
 
-    def check_consecutive_positive(data, days, max_gain_pct):
-        if len(data) < days:
+    def check_consecutive_positive(days, max_gain_pct):
+        if len(is_up_7) < days:
             return False, 0.0
-        sub = data.tail(days)
-        is_all_up = (sub['收盘'] > sub['开盘']).all()
-        if not is_all_up:
+        if not is_up_7[-days:].all():
             return False, 0.0
-        gain = (sub.iloc[-1]['收盘'] - sub.iloc[0]['开盘']) / sub.iloc[0]['开盘'] * 100
+        gain = (closes_7[-1] - opens_7[-days]) / opens_7[-days] * 100
         return gain <= max_gain_pct, round(gain, 2)
 
-    # 三级强度判定
-    for days, max_gain, label, emoji in [
-        (7, 22.5, "7连阳", "🔥"),
-        (6, 17.5, "6连阳", "⭐"),
-        (5, 12.5, "5连阳", "⚡")
+    # 7/6连阳都包含5连阳：最近5根里有一根不是阳线就直接出局
+    # 绝大多数票在这里退出，不用再跑三个窗口的判定
+    if not is_up_7[-5:].all():
+        return None
+
+    # 三级强度判定（rank在这里就定好，结果表排序不用再反解字符串）
+    for days, max_gain, label, emoji, rank in [
+        (7, 22.5, "7连阳", "🔥", 3),
+        (6, 17.5, "6连阳", "⭐", 2),
+        (5, 12.5, "5连阳", "⚡", 1)
     ]:
-        match, gain = check_consecutive_positive(hist_7, days, max_gain)
+        match, gain = check_consecutive_positive(days, max_gain)
         if match:
             return {
                 "代码": code,
@@ -90,7 +102,9 @@ def process_single_stock(code, name, current_price, turnover_rate, sector_info):
                 "强度": f"{emoji} {label} ≤{max_gain}%",
                 "涨幅": f"{gain}%",
                 "板块": sector_info,
-                "扫描时间": get_beijing_time()
+                "扫描时间": scan_ts,
+                "强度排序": rank,
+                "涨幅值": gain
             }
     return None
 
@@ -113,18 +127,23 @@ if check_password():
     if st.button("🔥 开始全速扫描", type="primary", use_container_width=True):
         with st.spinner("正在获取活跃标的池..."):
             if selected_scope == "全市场扫描":
-                df_pool = ak.stock_zh_a_spot_em()
+                df_pool = get_spot_snapshot()
             else:
-                df_pool = ak.stock_board_industry_cons_em(symbol=selected_scope)
+                df_pool = get_industry_cons(selected_scope)
 
-            # 核心过滤
+            # 核心过滤（字面量匹配代替正则，且后续只读不写，无需copy）
+            bad_name = (
+                df_pool['名称'].str.contains("ST", regex=False, na=False) |
+                df_pool['名称'].str.contains("退市", regex=False, na=False)
+            )
             df_pool = df_pool[
-                (~df_pool['名称'].str.contains("ST|退市", na=False)) &
+                ~bad_name &
                 (~df_pool['代码'].str.startswith(("30", "688", "9"))) &
                 (df_pool['换手率'] >= min_turnover)
-            ].copy()
+            ]
 
-        stocks = df_pool[['代码', '名称', '最新价', '换手率']].values.tolist()
+        # itertuples不经过.values的全表dtype统一（混合列会整体升级成object数组）
+        stocks = list(df_pool[['代码', '名称', '最新价', '换手率']].itertuples(index=False, name=None))
         total = len(stocks)
 
         if total == 0:
@@ -140,38 +159,41 @@ if check_password():
         results = []
         captured_count = 0
         start = time.time()
+        scan_ts = get_beijing_time()  # 一次扫描共用一个时间戳
 
         with ThreadPoolExecutor(max_workers=max_threads) as executor:
             futures = {
-                executor.submit(process_single_stock, s[0], s[1], s[2], s[3], selected_scope): s
+                executor.submit(process_single_stock, s[0], s[1], s[2], s[3], selected_scope, scan_ts): s
                 for s in stocks
             }
 
+            recent_hits = deque(maxlen=5)  # 最近捕获滚动展示，代替逐条toast
+            last_ui_update = 0.0
+
             for i, future in enumerate(as_completed(futures)):
                 res = future.result()
                 if res:
                     results.append(res)
                     captured_count += 1
-                    st.toast(f"捕获：{res['名称']} {res['强度']}", icon="✅")
-
-                # 更新进度
-                pct = (i + 1) / total
-                progress_bar.progress(pct)
-                
-                # 每10条更新一次状态
-                if (i + 1) % 10 == 0 or i == total - 1:
-                    elapsed = time.time() - start
+                    recent_hits.append(f"{res['名称']} {res['强度']}")
+
+                # 进度/状态节流到每0.1秒更新一次，避免刷爆websocket
+                now = time.time()
+                if now - last_ui_update > 0.1 or i == total - 1:
+                    last_ui_update = now
+                    elapsed = now - start
                     speed = (i + 1) / elapsed if elapsed > 0 else 0
+                    progress_bar.progress((i + 1) / total)
                     status.markdown(
                         f"**扫描进度**：{i+1:,}/{total:,} | "
                         f"已捕获 **{captured_count}** 只 | "
                         f"速度 ≈ {speed:.1f} 条/秒 | "
                         f"耗时 {elapsed:.1f} 秒"
+                        + (f" | 最近捕获：{'、'.join(recent_hits)}" if recent_hits else "")
                     )
-                    
-                    # 实时统计面板
+
+                    # 实时统计面板（只更新计数，不重建DataFrame）
                     if results:
-                        temp_df = pd.DataFrame(results)
                         stats_container.metric("当前捕获数量", captured_count)
 
         # ── 结果展示 ──
@@ -181,23 +203,17 @@ if check_password():
         if results:
             df_result = pd.DataFrame(results)
             
-            # 排序：强度优先（7>6>5） → 涨幅降序
-            df_result['强度排序'] = df_result['强度'].map({
-                "🔥 7连阳 ≤22.5%": 3,
-                "⭐ 6连阳 ≤17.5%": 2,
-                "⚡ 5连阳 ≤12.5%": 1
-            }).fillna(0)
-            df_result = df_result.sort_values(['强度排序', '涨幅'], ascending=[False, False]).drop(columns='强度排序')
+            # 排序：强度优先（7>6>5） → 涨幅降序（用数值列，'9.8%'这类字符串按字典序排会乱）
+            df_result = df_result.sort_values(
+                ['强度排序', '涨幅值'], ascending=[False, False]
+            ).drop(columns=['强度排序', '涨幅值'])
 
             # 美化展示
             st.subheader(f"捕获结果（{len(df_result)} 只）")
 
-            # 使用aggrid或st.dataframe + 样式
+            # 不走Styler（逐格调用lambda渲染），格式化交给column_config
             st.dataframe(
-                df_result.style.format({
-                    '现价': '{:.2f}',
-                    '涨幅': lambda x: f'<span style="color:{ "red" if float(x.rstrip("%")) > 0 else "green"}">{x}</span>'
-                }, escape=False),
+                df_result,
                 use_container_width=True,
                 column_config={
                     "代码": st.column_config.TextColumn("代码", width="small"),
@@ -212,12 +228,13 @@ if check_password():
 
             # 导出
             output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
+            with pd.ExcelWriter(output, engine='xlsxwriter',
+                                engine_kwargs={'options': {'constant_memory': True}}) as writer:
                 df_result.to_excel(writer, index=False, sheet_name="核心标的")
             st.download_button(
                 "📥 下载 Excel 结果",
                 output.getvalue(),
-                file_name=f"游资核心_{get_beijing_time()[:10]}.xlsx",
+                file_name=f"游资核心_{scan_ts[:10]}.xlsx",
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
                 use_container_width=True
             )